@@ -7,6 +7,10 @@ try:
     import ConfigParser as configparser
 except ImportError:
     import configparser
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
 import re
 import collections
 import ast
@@ -61,152 +65,349 @@ that argument.
 """
 
 _EMPTY = object()
+_FALSE = frozenset(('no', 'false', 'off'))
+_TRUE = frozenset(('yes', 'true', 'on'))
+# Characters that can start a literal: numbers, containers, strings (with any
+# prefix) and None. True/False are handled by the boolean word check.
+_LITERAL_FIRSTCHARS = frozenset("0123456789+-.[({\"'NbBrRuU")
+
+# Evaluated results, keyed by the raw string and its type (on Python 2 equal
+# str and unicode values would otherwise collide). Only immutable results
+# are stored, so callers never share a list or dict.
+_EVAL_CACHE = {}
+_EVAL_CACHE_SIZE = 1024
+
+# Bound on each parser's optionxform cache, which also sees names that are
+# looked up but never found.
+_XFORM_CACHE_SIZE = 1024
+
+# Parsed expression trees for literals whose values are mutable, keyed like
+# _EVAL_CACHE. Immutable results live in _EVAL_CACHE instead, and
+# literal_eval builds new values from a tree each time, so mutable results
+# are never shared.
+_PARSE_CACHE = {}
+_PARSE_CACHE_SIZE = 2048
+
+def _parse_value(val, _literal_eval=ast.literal_eval, _parse=ast.parse):
+    # Leading blanks are dropped as Python 3's literal_eval does
+    s = val.lstrip(" \t")
+    if s and s[0] in _LITERAL_FIRSTCHARS:
+        key = (type(s), s)
+        tree = _PARSE_CACHE.get(key)
+        if tree is None:
+            try:
+                tree = _parse(s, mode='eval')
+            except Exception:
+                pass
+        if tree is not None:
+            try:
+                result = _literal_eval(tree)
+            except Exception:
+                pass
+            else:
+                if not _cacheable(result):
+                    if len(_PARSE_CACHE) >= _PARSE_CACHE_SIZE:
+                        _PARSE_CACHE.clear()
+                    _PARSE_CACHE[key] = tree
+                return result
+    lv = val.lower()
+    if lv in _FALSE:
+        return False
+    if lv in _TRUE:
+        return True
+    return val
+
+def _cacheable(val):
+    # literal_eval only produces hashable values for immutable types (a tuple
+    # containing a list is unhashable too).
+    try:
+        hash(val)
+    except TypeError:
+        return False
+    return True
+
+# Helper class to make access to a given section easier
+
+class ConfigSection(object):
+    __slots__ = ('cfg', 'section', '_get', '_getlist', '_geteval',
+                 '_opts_cache', '_items_cache')
+    def __init__(self, cfg, section):
+        self.cfg = cfg
+        self.section = section
+        self._get = cfg.get
+        self._getlist = cfg.getlist
+        self._geteval = cfg.geteval
+        # (generation, result) pairs, discarded once the parser changes
+        self._opts_cache = None
+        self._items_cache = None
+    def options(self):
+        cache = self._opts_cache
+        if cache is None or cache[0] != self.cfg._generation:
+            cache = self._opts_cache = (self.cfg._generation,
+                                        self.cfg.options(self.section))
+        return list(cache[1])
+    def has_option(self, option):
+        return self.cfg.has_option(self.section, option)
+    def get(self, option, raw=False, vars=None, evaluate=False,
+            default=_EMPTY):
+        return self._get(self.section, option, raw=raw, vars=vars,
+                         evaluate=evaluate, default=default)
+    def getlist(self, option, evaluate=False, default=_EMPTY):
+        return self._getlist(self.section, option, evaluate=evaluate,
+                             default=default)
+    def geteval(self, option, default=_EMPTY):
+        return self._geteval(self.section, option, default=default)
+    def items(self):
+        cache = self._items_cache
+        if cache is None or cache[0] != self.cfg._generation:
+            cache = self._items_cache = (self.cfg._generation,
+                                         self.cfg.items(self.section))
+        return list(cache[1])
 
 class CfgParser(configparser.ConfigParser):
-    SPLITTER = re.compile("[,\n]")
+    _CAT_RE = re.compile(r"^\s*([^:\s](?:[^:]*[^:\s])?)\s*:"
+                         r"\s*([^:\s](?:[^:]*[^:\s])?)\s*$")
 
-    def __init__(self, defaults={}, dict_type=collections.OrderedDict,
+    def __init__(self, defaults=None, dict_type=collections.OrderedDict,
                  allow_no_value=False):
+        # The base constructor may add defaults through the overridden
+        # mutators below, so the caches must exist first.
+        self._generation = 0
+        self._invalidate()
         configparser.ConfigParser.__init__(self, defaults=defaults,
                                            dict_type=dict_type,
                                            allow_no_value=allow_no_value)
-        self._categories = None
-
-    # Helper class to make access to a given section easier
-
-    class ConfigSection(object):
-        def __init__(self, cfg, section):
-            self.cfg = cfg
-            self.section = section
-        def options(self):
-            return self.cfg.options(self.section)
-        def has_option(self, option):
-            return self.cfg.has_option(self.section, option)
-        def get(self, option, raw=False, vars=None, evaluate=False,
-                default=_EMPTY):
-            return self.cfg.get(self.section, option, raw=raw, vars=vars,
-                                evaluate=evaluate, default=default)
-        def getlist(self, option, evaluate=False, default=_EMPTY):
-            return self.cfg.getlist(self.section, option, evaluate=evaluate,
-                                    default=default)
-        def geteval(self, option, default=_EMPTY):
-            return self.cfg.geteval(self.section, option, default=default)
-        def items(self):
-            return self.cfg.items(self.section)
+
+    if not hasattr(configparser.ConfigParser, 'read_string'):
+        # Python 2 lacks read_string, so provide the Python 3 API.
+        def read_string(self, string, source='<string>'):
+            self.readfp(StringIO(string), source)
+
+    # Invalidate cached state whenever the underlying config changes
+
+    def _invalidate(self):
+        # Category -> name -> section, for enumeration, plus a flat
+        # (category, name) -> section index for single lookups.
+        self._categories = collections.OrderedDict()
+        self._flat_cats = {}
+        self._scanned = 0
+        self._eval_cache = {}
+        # Also picks up an optionxform assigned before the config is read
+        self._xform_cache = {}
+        self._generation += 1
+
+    def _read(self, fp, fpname):
+        # A failed read can still have added sections and options
+        try:
+            configparser.ConfigParser._read(self, fp, fpname)
+        finally:
+            self._invalidate()
+
+    def add_section(self, section):
+        configparser.ConfigParser.add_section(self, section)
+        self._invalidate()
+
+    def remove_section(self, section):
+        existed = configparser.ConfigParser.remove_section(self, section)
+        self._invalidate()
+        return existed
+
+    def set(self, section, option, value=None):
+        configparser.ConfigParser.set(self, section, option, value)
+        self._invalidate()
+
+    def remove_option(self, section, option):
+        existed = configparser.ConfigParser.remove_option(self, section,
+                                                          option)
+        self._invalidate()
+        return existed
+
+    # Kept as a class attribute for backwards compatibility
+    ConfigSection = ConfigSection
 
     def section(self, section, category=None):
         if category is None:
-            return self.ConfigSection(self, section)
+            return ConfigSection(self, section)
         else:
-            self._parse_categories()
-            return self.ConfigSection(self,
-                      self._categories[self.optionxform(category)][section])
+            fullname = self._resolve(self._xf(category), section)
+            if fullname is None:
+                raise configparser.NoSectionError("%s: %s" %
+                                                  (category, section))
+            return ConfigSection(self, fullname)
 
     # Support for Categories
 
-    def _parse_categories(self):
-        if self._categories is not None:
-            return
-        self._categories = collections.OrderedDict()
-        for fullname in self.sections():
-            section = self.optionxform(fullname).strip()
-            if section.count(':') == 1:
-                cat, name = map(str.strip, section.split(':'))
-                secs = self._categories.setdefault(cat,
-                                                   collections.OrderedDict())
-                secs[name] = fullname
+    def _xf(self, s):
+        # Memoised optionxform, as the same category and section names are
+        # transformed on every categorised lookup.
+        cache = self._xform_cache
+        r = cache.get(s)
+        if r is None:
+            if len(cache) >= _XFORM_CACHE_SIZE:
+                cache.clear()
+            r = cache[s] = self.optionxform(s)
+        return r
+
+    def _scan_categories(self, cat=None, name=None):
+        # Sections are parsed into categories lazily: each call carries on
+        # from where the previous one stopped, and returns early as soon as
+        # the "cat: name" section is found. Without a target the remaining
+        # sections are all scanned.
+        if self._scanned == len(self._sections):
+            # Fully scanned: avoid copying the section list on every miss
+            return None
+        sections = self.sections()
+        xf = self._xf
+        match = self._CAT_RE.match
+        cats = self._categories
+        flat = self._flat_cats
+        for i in range(self._scanned, len(sections)):
+            fullname = sections[i]
+            m = match(xf(fullname))
+            if m:
+                c, n = m.groups()
+                secs = cats.get(c)
+                if secs is None:
+                    secs = cats[c] = collections.OrderedDict()
+                secs.setdefault(n, fullname)
+                flat.setdefault((c, n), fullname)
+                if c == cat and n == name:
+                    self._scanned = i + 1
+                    return fullname
+        self._scanned = len(sections)
+        return None
+
+    def _resolve(self, cat, name):
+        # Returns None rather than raising, so probes stay exception-free
+        fullname = self._flat_cats.get((cat, name))
+        if fullname is None:
+            fullname = self._scan_categories(cat, name)
+        return fullname
+
+    def _category_section(self, section, category):
+        fullname = self._resolve(self._xf(category), self._xf(section))
+        if fullname is None:
+            raise configparser.NoSectionError("%s: %s" % (category, section))
+        return fullname
+
+    def _lacks_option(self, section, option):
+        # True if the section exists without the option, i.e. get would
+        # raise NoOptionError. Missing sections are left to raise as usual.
+        return (not configparser.ConfigParser.has_option(self, section,
+                                                         option) and
+                configparser.ConfigParser.has_section(self, section))
 
     def categories(self):
-        self._parse_categories()
+        self._scan_categories()
         return self._categories.keys()
 
     def sections(self, category=None):
         if category is None:
             return configparser.ConfigParser.sections(self)
         else:
-            self._parse_categories()
-            return self._categories[self.optionxform(category)].keys()
+            self._scan_categories()
+            return self._categories[self._xf(category)].keys()
 
     def has_section(self, section, category=None):
         if category is None:
             return configparser.ConfigParser.has_section(self, section)
         else:
-            self._parse_categories()
-            return (self.optionxform(category) in self._categories and
-                    section in self._categories[self.optionxform(category)])
+            return self._resolve(self._xf(category), section) is not None
 
     def options(self, section, category=None):
         if category is None:
             return configparser.ConfigParser.options(self, section)
         else:
-            self._parse_categories()
             return configparser.ConfigParser.options(self,
-                       self._categories[self.optionxform(category)]
-                                       [self.optionxform(section)])
+                       self._category_section(section, category))
 
     def has_option(self, section, option, category=None):
         if category is None:
             return configparser.ConfigParser.has_option(self, section, option)
         else:
-            self._parse_categories()
-            return configparser.ConfigParser.has_option(self,
-                        self._categories[self.optionxform(category)]
-                                        [self.optionxform(section)], option)
+            section = self._resolve(self._xf(category), self._xf(section))
+            if section is None:
+                return False
+            return configparser.ConfigParser.has_option(self, section, option)
 
     def items(self, section, category=None):
         if category is None:
             return configparser.ConfigParser.items(self, section)
         else:
-            self._parse_categories()
             return configparser.ConfigParser.items(self,
-                            self._categories[self.optionxform(category)]
-                                            [self.optionxform(section)])
+                       self._category_section(section, category))
 
-    def get(self, section, option, raw=False, vars={}, category=None,
+    # Looked up once here rather than through the MRO on every get
+    _base_get = configparser.ConfigParser.get
+
+    def get(self, section, option, raw=False, vars=None, category=None,
             evaluate=False, default=_EMPTY):
+        if category is None and default is _EMPTY and not evaluate:
+            return self._base_get(section, option, raw=raw, vars=vars)
         if category is not None:
-            self._parse_categories()
+            fullname = self._resolve(self._xf(category), self._xf(section))
+            if fullname is None:
+                if default is not _EMPTY:
+                    return default
+                raise configparser.NoSectionError("%s: %s" %
+                                                  (category, section))
+            section = fullname
+        if (default is not _EMPTY and not vars and
+                self._lacks_option(section, option)):
+            return default
+        cache = evaluate and not raw and not vars
+        if cache:
             try:
-                section = (self._categories[self.optionxform(category)]
-                                           [self.optionxform(section)])
+                return self._eval_cache[(section, option)]
             except KeyError:
-                if default != _EMPTY:
-                    return default
-                raise configparser.NoSectionError
+                pass
         try:
-            val = configparser.ConfigParser.get(self, section, option,
-                                                raw=raw, vars=vars)
+            val = self._base_get(section, option, raw=raw, vars=vars)
         except configparser.NoOptionError:
-            if default != _EMPTY:
+            if default is not _EMPTY:
                 return default
             raise
 
         if evaluate:
             val = self._evaluate(val)
+            if cache and _cacheable(val):
+                self._eval_cache[(section, option)] = val
         return val
 
     # Support for evaluated values and lists of values
 
     @staticmethod
     def _evaluate(val):
+        key = (type(val), val)
         try:
-            return ast.literal_eval(val)
-        except Exception:
-            if val.lower() in {'no', 'false', 'off'}:
-                val = False
-            elif val.lower() in {'yes', 'true', 'on'}:
-                val = True
-            return val
+            return _EVAL_CACHE[key]
+        except KeyError:
+            pass
+        result = _parse_value(val)
+        if _cacheable(result):
+            if len(_EVAL_CACHE) >= _EVAL_CACHE_SIZE:
+                _EVAL_CACHE.clear()
+            _EVAL_CACHE[key] = result
+        return result
 
     def getlist(self, section, option, evaluate=False, category=None,
                 default=_EMPTY):
+        if category is not None:
+            section = self._category_section(section, category)
+        if default is not _EMPTY and self._lacks_option(section, option):
+            return default
         try:
-            val = self.get(section, option, category=category)
+            val = self.get(section, option)
         except configparser.NoOptionError:
             if default is not _EMPTY:
                 return default
             raise
-        lst = [s.strip() for s in self.SPLITTER.split(val) if s.strip()]
+        lst = []
+        for line in val.split('\n'):
+            for item in line.split(','):
+                item = item.strip()
+                if item:
+                    lst.append(item)
         if evaluate:
             return [self._evaluate(i) for i in lst]
         else:
@@ -4,11 +4,8 @@
 # -----------------------------------------------------------------------------
 
 import cfgparser
+import sys
 import unittest
-try:
-    from StringIO import StringIO
-except ImportError:
-    from io import StringIO
 
 _example_file = """
 [evalvals]
@@ -55,7 +52,7 @@ type = add
 class EvaluatedValuesTest(unittest.TestCase):
     def setUp(self):
         self.cfg = cfgparser.CfgParser()
-        self.cfg.readfp(StringIO(_example_file))
+        self.cfg.read_string(_example_file)
 
     def test_configsectionhelper(self):
         s = self.cfg.section("bar", category="command")
@@ -87,6 +84,130 @@ class EvaluatedValuesTest(unittest.TestCase):
                          [("type", "add")])
         self.assertEqual(len(self.cfg.items("listvals")), 5)
 
+    def test_lazy_categories(self):
+        self.assertEqual(self.cfg.get("bar", "dir", category="command"), "baz")
+        self.assertEqual(list(self.cfg.sections("command")),
+                         ["foo", "bar", "baz"])
+        self.assertTrue(self.cfg.has_section("hello", category="results"))
+        self.assertEqual(list(self.cfg.categories()), ["command", "results"])
+
+    def test_no_rescan_when_complete(self):
+        self.assertEqual(list(self.cfg.categories()), ["command", "results"])
+        # Count full section listings, which a completed scan should not need
+        calls = []
+        sections = self.cfg.sections
+        def counting_sections(category=None):
+            if category is None:
+                calls.append(category)
+            return sections(category)
+        self.cfg.sections = counting_sections
+        self.assertFalse(self.cfg.has_section("nope", category="command"))
+        self.assertEqual(self.cfg.get("nope", "dir", category="command",
+                                      default=1), 1)
+        self.assertEqual(list(self.cfg.categories()), ["command", "results"])
+        self.assertEqual(list(self.cfg.sections("command")),
+                         ["foo", "bar", "baz"])
+        self.assertEqual(calls, [])
+
+    def test_duplicate_category_names(self):
+        # The first section wins, even when it has already been resolved
+        self.cfg.read_string("[Command : foo]\ndir = other\n")
+        self.assertEqual(self.cfg.get("foo", "dir", category="command"), "bar")
+        self.assertEqual(list(self.cfg.sections("command")),
+                         ["foo", "bar", "baz"])
+        self.assertEqual(self.cfg.get("foo", "dir", category="command"), "bar")
+
+    def test_malformed_categories(self):
+        self.cfg.read_string("[foo:]\n[ : anon]\n[a:b:c]\n"
+                             "[ spaced out : some name ]\n")
+        self.assertEqual(list(self.cfg.categories()),
+                         ["command", "results", "spaced out"])
+        self.assertEqual(list(self.cfg.sections("spaced out")),
+                         ["some name"])
+
+    def test_missing_category(self):
+        self.assertFalse(self.cfg.has_option("foo", "dir", category="nope"))
+        self.assertFalse(self.cfg.has_option("nope", "dir", category="command"))
+        self.assertRaises(cfgparser.configparser.NoSectionError,
+                          self.cfg.options, "foo", category="nope")
+        self.assertRaises(cfgparser.configparser.NoSectionError,
+                          self.cfg.items, "nope", category="command")
+        self.assertRaises(cfgparser.configparser.NoSectionError,
+                          self.cfg.get, "foo", "dir", category="nope")
+        self.assertEqual(self.cfg.get("foo", "dir", category="nope",
+                                      default=1), 1)
+
+    def test_defaults(self):
+        self.assertEqual(self.cfg.get("evalvals", "nope", default=None), None)
+        self.assertEqual(self.cfg.getlist("listvals", "nope", default=[]), [])
+        self.assertEqual(self.cfg.geteval("foo", "nope", category="command",
+                                          default=3), 3)
+        self.assertEqual(self.cfg.geteval("evalvals", "val1", default=3), 42)
+        self.assertRaises(cfgparser.configparser.NoSectionError,
+                          self.cfg.get, "nope", "val1", default=None)
+        self.assertRaises(cfgparser.configparser.NoOptionError,
+                          self.cfg.getlist, "listvals", "nope")
+
+    def test_optionxform_change(self):
+        self.assertTrue(self.cfg.has_section("baz", category="command"))
+        self.cfg.optionxform = str
+        self.cfg.read_string("[extra: one]\n")
+        self.assertFalse(self.cfg.has_section("baz", category="command"))
+        self.assertTrue(self.cfg.has_section("baz", category="CoMmaNd"))
+        self.assertEqual(list(self.cfg.categories()),
+                         ["command", "Command", "CoMmaNd", "results",
+                          "extra"])
+
+    def test_cache_invalidation(self):
+        self.assertEqual(self.cfg.geteval("evalvals", "val1"), 42)
+        self.cfg.set("evalvals", "val1", "43")
+        self.assertEqual(self.cfg.geteval("evalvals", "val1"), 43)
+        self.assertEqual(list(self.cfg.categories()), ["command", "results"])
+        self.cfg.add_section("extra: one")
+        self.assertEqual(list(self.cfg.categories()),
+                         ["command", "results", "extra"])
+        self.cfg.remove_section("results: hello")
+        self.assertFalse(self.cfg.has_section("hello", category="results"))
+
+    def test_configsection_cache(self):
+        s = self.cfg.section("foo", category="command")
+        self.assertEqual(s.options(), ["dir"])
+        self.assertEqual(s.items(), [("dir", "bar")])
+        self.cfg.set("command: foo", "dir", "quux")
+        self.cfg.set("command: foo", "extra", "1")
+        self.assertEqual(s.options(), ["dir", "extra"])
+        self.assertEqual(s.items(), [("dir", "quux"), ("extra", "1")])
+
+    def _failed_read(self):
+        self.assertRaises(cfgparser.configparser.ParsingError,
+                          self.cfg.read_string,
+                          "[evalvals]\nval1 = 43\nval15 = 1\nbad line\n")
+
+    def test_failed_read_options(self):
+        s = self.cfg.section("evalvals")
+        self.assertEqual(len(s.options()), 14)
+        self._failed_read()
+        self.assertEqual(len(s.options()), 15)
+
+    @unittest.skipIf(sys.version_info[0] < 3,
+                     "Python 2 leaves the values of a failed read unjoined")
+    def test_failed_read_values(self):
+        self.assertEqual(self.cfg.geteval("evalvals", "val1"), 42)
+        self._failed_read()
+        self.assertEqual(self.cfg.geteval("evalvals", "val1"), 43)
+
+    def test_eval_cache_keeps_type(self):
+        other = cfgparser.CfgParser()
+        other.read_string(u"[evalvals]\nval2 = this is a string\n")
+        self.assertIs(type(other.geteval("evalvals", "val2")), type(u""))
+        self.assertIs(type(self.cfg.geteval("evalvals", "val2")), str)
+
+    def test_eval_results_not_shared(self):
+        v = self.cfg.geteval("evalvals", "val10")
+        v.append(6)
+        self.assertEqual(self.cfg.geteval("evalvals", "val10"),
+                         [1, 5, "hello"])
+
     def _checklen(self, field, num):
         self.assertEqual(len(self.cfg.getlist("listvals", field)), num)
 
@@ -104,6 +225,11 @@ class EvaluatedValuesTest(unittest.TestCase):
         v = self.cfg.getlist("listvals", "val5", evaluate=True)
         self.assertEqual(v, [1, 2, 3, None, False, True])
 
+    def test_list_separators(self):
+        self.cfg.set("listvals", "val6", "x\ry, z\x0cw")
+        self.assertEqual(self.cfg.getlist("listvals", "val6"),
+                         ["x\ry", "z\x0cw"])
+
     def _checktype(self, field, typ):
         self.assertIsInstance(self.cfg.geteval("evalvals", field), typ)
          